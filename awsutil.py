@@ -10,8 +10,63 @@
 
 import boto3
 import logging
+import os
 import uuid
 import pathlib
+import concurrent.futures
+
+from boto3.s3.transfer import TransferConfig
+
+
+#
+# objects larger than 8MB are transferred as 8MB parts, up to
+# 10 parts at a time over parallel connections:
+#
+MB = 1024 * 1024
+
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * MB,
+                                 multipart_chunksize=8 * MB,
+                                 max_concurrency=10,
+                                 use_threads=True)
+
+#
+# # of files download_many transfers at a time by default; with
+# each file in up to TRANSFER_CONFIG.max_concurrency parts, the
+# S3 client needs DOWNLOAD_WORKERS * max_concurrency connections:
+#
+DOWNLOAD_WORKERS = 16
+
+
+###################################################################
+#
+# count_objects
+#
+# ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/paginator/ListObjectsV2.html
+#
+def count_objects(bucket):
+  """
+  Counts the objects in an S3 bucket, summing the per-page KeyCount
+  rather than materializing every object summary
+
+  Parameters
+  ----------
+  bucket : S3 bucket to count
+  
+  Returns
+  -------
+  # of objects in the bucket or None upon an error
+  """
+
+  try:
+    paginator = bucket.meta.client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket.name)
+    #
+    return sum(pages.search('KeyCount'))
+
+  except Exception as e:
+    logging.error("awss3.count_objects() failed:")
+    logging.error(e)
+    return None
 
 
 ###################################################################
@@ -20,16 +75,18 @@ import pathlib
 #
 # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/bucket/download_file.html
 #
-def download_file(bucket, key, filename=None):
+def download_file(bucket, key, filename=None, size=None):
   """
-  Downloads a file from an S3 bucket
+  Downloads a file from an S3 bucket; if the object's size is
+  known, the download is planned from it and no HEAD request
+  is needed
 
   Parameters
   ----------
   bucket : S3 bucket to download from, 
   key : object's name in bucket,
-  original_fname: name to save object as
-  
+  original_fname: name to save object as,
+  size : optional size of the object in bytes
   
   Returns
   -------
@@ -45,9 +102,12 @@ def download_file(bucket, key, filename=None):
       extension = pathlib.Path(key).suffix
       filename += extension
     #
-    # downoad:
+    # downoad (in parallel parts if the object is large):
     #
-    bucket.download_file(key, filename)
+    if size is None:
+      bucket.download_file(key, filename, Config=TRANSFER_CONFIG)
+    else:
+      _download_ranges(bucket, key, filename, size)
     #
     return filename
 
@@ -57,6 +117,145 @@ def download_file(bucket, key, filename=None):
     return None
 
 
+###################################################################
+#
+# _download_ranges
+#
+# Downloads an object of known size with ranged GETs, in parallel
+# parts if it is large, writing to a temporary file that is
+# renamed to filename once complete.
+#
+def _download_ranges(bucket, key, filename, size):
+  """
+  Downloads an object from an S3 bucket without a HEAD request,
+  using its known size to plan ranged GETs; if the object turns
+  out to be a different size, falls back to a regular download
+
+  Parameters
+  ----------
+  bucket : S3 bucket to download from, 
+  key : object's name in bucket,
+  filename : name to save object as,
+  size : expected size of the object in bytes
+  
+  Returns
+  -------
+  nothing; raises an exception upon an error
+  """
+
+  client = bucket.meta.client
+  chunksize = TRANSFER_CONFIG.multipart_chunksize
+  tmp_filename = filename + "." + uuid.uuid4().hex
+
+  def fetch(start):
+    end = min(start + chunksize, size) - 1
+    response = client.get_object(Bucket=bucket.name,
+                                 Key=key,
+                                 Range=f"bytes={start}-{end}")
+    with open(tmp_filename, 'r+b') as f:
+      f.seek(start)
+      f.write(response['Body'].read())
+    return response
+
+  try:
+    if size <= TRANSFER_CONFIG.multipart_threshold:
+      # a single GET returns the whole object whatever its size:
+      response = client.get_object(Bucket=bucket.name, Key=key)
+      with open(tmp_filename, 'wb') as f:
+        f.write(response['Body'].read())
+    else:
+      with open(tmp_filename, 'wb') as f:
+        f.truncate(size)
+      #
+      # the first part reports the object's total size, e.g.
+      # "bytes 0-8388607/20971520"; if it isn't the size we
+      # planned with, the parts would be wrong:
+      #
+      response = fetch(0)
+      total = int(response['ContentRange'].rsplit('/', 1)[1])
+      if total != size:
+        os.remove(tmp_filename)
+        bucket.download_file(key, filename, Config=TRANSFER_CONFIG)
+        return
+
+      with concurrent.futures.ThreadPoolExecutor(
+          max_workers=TRANSFER_CONFIG.max_concurrency) as executor:
+        list(executor.map(fetch, range(chunksize, size, chunksize)))
+
+    os.replace(tmp_filename, filename)
+
+  except Exception:
+    if os.path.exists(tmp_filename):
+      os.remove(tmp_filename)
+    raise
+
+
+###################################################################
+#
+# download_many
+#
+def download_many(bucket, keys, filenames=None, sizes=None, max_workers=DOWNLOAD_WORKERS):
+  """
+  Downloads several files from an S3 bucket in parallel; the
+  workers share the bucket's client and its connection pool
+
+  Parameters
+  ----------
+  bucket : S3 bucket to download from, 
+  keys : list of objects' names in bucket,
+  filenames : optional list of names to save objects as (one per key),
+  sizes : optional list of object sizes in bytes (one per key, None if unknown),
+  max_workers : max # of files downloaded at a time
+  
+  Returns
+  -------
+  list of filenames of downloaded files, in the order of keys, with
+  None for each file that could not be downloaded
+  """
+
+  if filenames is None:
+    filenames = [None] * len(keys)
+  if sizes is None:
+    sizes = [None] * len(keys)
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    return list(executor.map(lambda key, filename, size: download_file(bucket, key, filename, size),
+                              keys,
+                              filenames,
+                              sizes))
+
+
+###################################################################
+#
+# get_object_bytes
+#
+# ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/object/get.html
+#
+def get_object_bytes(bucket, key):
+  """
+  Reads an object from an S3 bucket into memory
+
+  Parameters
+  ----------
+  bucket : S3 bucket to read from, 
+  key : object's name in bucket
+  
+  Returns
+  -------
+  contents of the object as bytes or None upon an error
+  """
+
+  try:
+    response = bucket.Object(key).get()
+    #
+    return response['Body'].read()
+
+  except Exception as e:
+    logging.error("awss3.get_object_bytes() failed:")
+    logging.error(e)
+    return None
+
+
 ###################################################################
 #
 # upload_file
@@ -66,7 +265,8 @@ def download_file(bucket, key, filename=None):
 def upload_file(local_filename, bucket, key):
   """
   Uploads a file to an S3 bucket, setting the content type to "image/jpeg" if
-  a jpg file and the permissions to be publicly readable
+  a jpg file and the permissions to be publicly readable; large files are
+  uploaded as a multipart upload with parts sent in parallel
 
   Parameters
   ----------
@@ -90,10 +290,41 @@ def upload_file(local_filename, bucket, key):
                        ExtraArgs={
                          'ACL': 'public-read',
                          'ContentType': content_type
-                       })
+                       },
+                       Config=TRANSFER_CONFIG)
     return key
 
   except Exception as e:
     logging.error("awss3.upload_file() failed:")
     logging.error(e)
     return None
+
+
+###################################################################
+#
+# delete_file
+#
+# ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/object/delete.html
+#
+def delete_file(bucket, key):
+  """
+  Deletes an object from an S3 bucket
+
+  Parameters
+  ----------
+  bucket : S3 bucket to delete from,
+  key : object's name in bucket
+  
+  Returns
+  -------
+  key that was passed in or None upon an error
+  """
+
+  try:
+    bucket.Object(key).delete()
+    return key
+
+  except Exception as e:
+    logging.error("awss3.delete_file() failed:")
+    logging.error(e)
+    return None
@@ -10,6 +10,21 @@
 
 import pymysql
 import logging
+import queue
+import threading
+import contextlib
+
+from pymysql.constants import ER, SERVER_STATUS
+
+
+#
+# raised by perform_action when the query violates a constraint;
+# args[0] is the MySQL error code, e.g. ER_NO_REFERENCED_ROW for
+# a foreign key that refers to a missing row:
+#
+IntegrityError = pymysql.err.IntegrityError
+
+ER_NO_REFERENCED_ROW = ER.NO_REFERENCED_ROW_2
 
 
 ###################################################################
@@ -19,7 +34,7 @@ import logging
 # Opens and returns a connection object for interacting with a
 # MySQL database.
 #
-def get_dbConn(endpoint, portnum, username, pwd, dbname):
+def get_dbConn(endpoint, portnum, username, pwd, dbname, autocommit=False):
   """
   Opens and returns a connection object for interacting 
   with a MySQL database
@@ -30,7 +45,9 @@ def get_dbConn(endpoint, portnum, username, pwd, dbname):
   portnum : server port # (integer),
   username : user name for login (string),
   pwd : user password for login (string),
-  dbname : database name (string)
+  dbname : database name (string),
+  autocommit : if True, each query is committed as it executes
+    (boolean, default False)
 
   Returns
   -------
@@ -41,12 +58,166 @@ def get_dbConn(endpoint, portnum, username, pwd, dbname):
                              port=portnum,
                              user=username,
                              passwd=pwd,
-                             database=dbname)
+                             database=dbname,
+                             autocommit=autocommit)
 
     return dbConn
 
   except Exception as e:
     logging.error("datatier.get_dbConn() failed:")
+    logging.error(e)
+    return None
+
+
+###################################################################
+#
+# ConnectionPool:
+#
+# A small pool of MySQL connections, opened on demand up to a
+# fixed size and handed out one at a time so that concurrent
+# work never shares a connection.
+#
+class ConnectionPool:
+  """
+  Pool of connections to a MySQL database; use as
+
+    with pool.connection() as dbConn:
+      ...
+
+  Connections are opened lazily (up to size) in autocommit mode,
+  so reads never hold a stale snapshot, and returned to the pool,
+  with any open transaction rolled back, when the with block
+  exits; a connection whose with block raises is closed instead
+  of being reused
+  """
+
+  def __init__(self, endpoint, portnum, username, pwd, dbname, size=10):
+    self._args = (endpoint, portnum, username, pwd, dbname)
+    self._idle = queue.LifoQueue()
+    self._slots = threading.BoundedSemaphore(size)
+
+  def _acquire(self):
+    #
+    # wait until fewer than size connections are in use:
+    #
+    self._slots.acquire()
+    #
+    # reuse an idle connection if there is one:
+    #
+    try:
+      return self._idle.get_nowait()
+    except queue.Empty:
+      pass
+    #
+    # otherwise open a new one:
+    #
+    dbConn = get_dbConn(*self._args, autocommit=True)
+    if dbConn is None:
+      self._slots.release()
+      raise ConnectionError("unable to connect to database")
+    return dbConn
+
+  @staticmethod
+  def _discard(dbConn):
+    try:
+      dbConn.close()
+    except Exception:
+      pass
+
+  @contextlib.contextmanager
+  def connection(self):
+    dbConn = self._acquire()
+    reuse = False
+    try:
+      yield dbConn
+      #
+      # end any transaction left open (e.g. by perform_action with
+      # commit=False) before the connection is reused:
+      #
+      try:
+        if in_transaction(dbConn):
+          dbConn.rollback()
+        reuse = True
+      except Exception:
+        pass
+    finally:
+      if reuse:
+        self._idle.put(dbConn)
+      else:  # failed or broken, don't hand it out again
+        self._discard(dbConn)
+      self._slots.release()
+
+  def close(self):
+    """
+    Closes all idle connections in the pool
+    """
+    while True:
+      try:
+        dbConn = self._idle.get_nowait()
+      except queue.Empty:
+        break
+      self._discard(dbConn)
+
+
+###################################################################
+#
+# in_transaction:
+#
+# Returns True if the connection has a transaction open; this
+# uses the status the server last reported, so it costs no
+# round-trip.
+#
+def in_transaction(dbConn):
+  """
+  Returns True if a transaction is open on the connection
+
+  Parameters
+  ----------
+  dbConn : the database connection
+
+  Returns
+  -------
+  True or False
+  """
+  return bool(dbConn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS)
+
+
+###################################################################
+#
+# get_dbPool:
+#
+# Creates and returns a pool of connection objects for
+# interacting with a MySQL database.
+#
+def get_dbPool(endpoint, portnum, username, pwd, dbname, size=10):
+  """
+  Creates and returns a connection pool for interacting with a
+  MySQL database; one connection is opened up front so that
+  bad credentials are reported immediately
+
+  Parameters
+  ----------
+  endpoint : machine name or IP address of server (string),
+  portnum : server port # (integer),
+  username : user name for login (string),
+  pwd : user password for login (string),
+  dbname : database name (string),
+  size : max # of connections in the pool (integer)
+
+  Returns
+  -------
+  a ConnectionPool object or None upon an error
+  """
+  dbPool = ConnectionPool(endpoint, portnum, username, pwd, dbname, size)
+
+  try:
+    with dbPool.connection():
+      pass
+
+    return dbPool
+
+  except Exception as e:
+    logging.error("datatier.get_dbPool() failed:")
     logging.error(e)
     return None
 
@@ -145,50 +316,120 @@ def retrieve_all_rows(dbConn, sql, parameters=[]):
     dbCursor.close()
 
 
+##################################################################
+#
+# iter_rows:
+#
+# Given a database connection and an SQL Select query,
+# executes this query against the database and yields the
+# rows (tuples) one at a time as they arrive from the server,
+# using an unbuffered cursor so the result set is never held
+# in memory all at once. The connection cannot be used for
+# anything else until the rows have been consumed. The query
+# can be parameterized using %s, in which case pass the
+# values as a list [value1, value2, ...]
+#
+def iter_rows(dbConn, sql, parameters=[], arraysize=1000):
+  """
+  Executes an sql SELECT query against the database connection
+  and yields the rows as tuples, streaming them from the server
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  arraysize: # of rows fetched from the server at a time
+
+  Returns
+  _______
+  Generator of rows as tuples (yields nothing if SELECT retrieves
+  no data); upon an error the error is logged and iteration stops
+  """
+
+  dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
+
+  try:
+    dbCursor.execute(sql, parameters)
+    while True:
+      rows = dbCursor.fetchmany(arraysize)
+      if not rows:  # all rows have been retrieved
+        break
+      yield from rows
+
+  except Exception as e:
+    logging.error("datatier.iter_rows() failed:")
+    logging.error(e)
+
+  finally:
+    dbCursor.close()
+
+
 ###############################################################
 #
 # perform_action:
 #
 # Given a database connection and an SQL action query,
 # executes an ACTION query and returns the number of rows
-# modified; a return value of 0 means no rows were
+# modified along with the id generated for an AUTO_INCREMENT
+# column (if any); a row count of 0 means no rows were
 # modified. Action queries are typically "insert",
 # "update", "delete". The query can be parameterized
 # using %s, in which case pass the values as a list
-# [value1, value2, ...]
+# [value1, value2, ...]. Constraint violations are raised
+# as IntegrityError so the caller can tell them apart. Pass
+# commit=False to leave the transaction open (one is begun if
+# the connection is in autocommit mode), in which case the
+# caller must commit or rollback.
 #
-def perform_action(dbConn, sql, parameters=[]):
+def perform_action(dbConn, sql, parameters=[], commit=True):
   """
   Executes an sql ACTION query against the database connection
-  and returns number of rows modified
+  and returns number of rows modified and the last inserted id
 
   Parameters
   __________
   dbConn : the database connection, 
   sql : the SQL SELECT query (can be parameterized with %s),
-  parameters: optional list of values if parameterized
+  parameters: optional list of values if parameterized,
+  commit: if False, the change is left uncommitted; default is True
 
   Returns
   _______
-  number of rows modified or -1 upon an error (0 is not an
-  error but implies the query made no modifications)
+  tuple (number of rows modified, last inserted id) or (-1, None)
+  upon an error (0 rows is not an error but implies the query made
+  no modifications; the id is None unless an AUTO_INCREMENT value
+  was generated); raises IntegrityError if a constraint (e.g. a
+  foreign key) is violated
   """
 
   dbCursor = dbConn.cursor()
 
   try:
     # try to execute, and if successful commit the changes
-    # and return the # of rows modified by the query:
+    # and return the # of rows modified by the query along with
+    # any AUTO_INCREMENT id it generated; in autocommit mode the
+    # server has already committed, unless a transaction is begun:
+    if not commit and dbConn.get_autocommit():
+      dbConn.begin()
     dbCursor.execute(sql, parameters)
-    dbConn.commit()
-    return dbCursor.rowcount
+    if commit and not dbConn.get_autocommit():
+      dbConn.commit()
+    return dbCursor.rowcount, (dbCursor.lastrowid or None)
+
+  except IntegrityError:
+    # constraint violated, rollback and let the caller handle it:
+    if in_transaction(dbConn):
+      dbConn.rollback()
+    raise
 
   except Exception as e:
     # failed, rollback any possible changes and log error:
-    dbConn.rollback()
+    if in_transaction(dbConn):
+      dbConn.rollback()
     logging.error("datatier.perform_action() failed:")
     logging.error(e)
-    return -1
+    return -1, None
 
   finally:
     dbCursor.close()
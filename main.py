@@ -12,9 +12,13 @@
 import datatier  # MySQL database access
 import awsutil  # helper functions for AWS
 import boto3  # Amazon AWS
+import botocore.config
 
+import io
 import uuid
-import pathlib
+import shlex
+import functools
+import concurrent.futures
 import logging
 import sys
 import os
@@ -25,13 +29,136 @@ import matplotlib.pyplot as plt
 import matplotlib.image as img
 
 
+###################################################################
+#
+# read_line
+#
+def read_line(message):
+  """
+  Writes a message and reads one line of input
+  
+  Parameters
+  ----------
+  message: text written before reading
+  
+  Returns
+  -------
+  line entered by user, without the trailing newline
+  """
+  sys.stdout.write(message)
+  sys.stdout.flush()
+
+  line = sys.stdin.readline()
+  if not line:  # end of input, as input() would report
+    raise EOFError("EOF when reading a line")
+  return line.rstrip("\n")
+
+###################################################################
+#
+# get_arg
+#
+def get_arg(args, i, message):
+  """
+  Returns the i-th argument given on the command line, or
+  prompts the user for it if not given
+  
+  Parameters
+  ----------
+  args: arguments given after the command number,
+  i: index of the argument,
+  message: prompt to use if the argument was not given
+  
+  Returns
+  -------
+  the argument as a string
+  """
+  if i < len(args):
+    return args[i]
+  return read_line(message + "\n")
+
+###################################################################
+#
+# parse_command
+#
+def parse_command(line):
+  """
+  Splits a line of input into a command number and its
+  arguments, e.g. "4 1003" => (4, ["1003"]); arguments may be
+  quoted to include spaces. Arguments that are not given are
+  prompted for when the command runs, so a bare command number
+  works interactively while a full line suits scripted input.
+  
+  Parameters
+  ----------
+  line: line entered by user
+  
+  Returns
+  -------
+  tuple (command number, list of arguments), where the command
+  number is None if the input is not a number
+  """
+  try:
+    tokens = shlex.split(line)
+    return int(tokens[0]), tokens[1:]
+  except (ValueError, IndexError):
+    return None, []
+
+###################################################################
+#
+# page_options
+#
+def page_options(args):
+  """
+  Returns the paging options for the users and assets commands
+  from their arguments: none, a page size (e.g. "2 20"), or
+  "all" to output every page without asking. When input is not
+  from a terminal (i.e. scripted), every page is output without
+  asking, so the next command isn't taken as the answer.
+  
+  Parameters
+  ----------
+  args: arguments given after the command number
+  
+  Returns
+  -------
+  tuple (page size, whether to ask before each further page)
+  """
+  page_size, ask_more = 50, sys.stdin.isatty()
+
+  if args and args[0] == "all":
+    ask_more = False
+  elif args:
+    try:
+      page_size = int(args[0])
+    except ValueError:
+      page_size = 0
+    if page_size <= 0:
+      print(f"** Invalid page size ' {args[0]} ', using 50...")
+      page_size = 50
+
+  return page_size, ask_more
+
 ###################################################################
 #
 # prompt
 #
+MENU = """
+>> Enter a command:
+   0 => end
+   1 => stats
+   2 => users
+   3 => assets
+   4 => download
+   5 => download and display
+   6 => upload
+   7 => add user
+   8 => download batch
+"""
+
 def prompt():
   """
-  Prompts the user and returns the command number
+  Prompts the user and returns the command number and any
+  arguments given on the same line
   
   Parameters
   ----------
@@ -39,28 +166,15 @@ def prompt():
   
   Returns
   -------
-  Command number entered by user (0, 1, 2, ...)
+  tuple (command number, list of arguments); see parse_command
   """
-  print()
-  print(">> Enter a command:")
-  print("   0 => end")
-  print("   1 => stats")
-  print("   2 => users")
-  print("   3 => assets")
-  print("   4 => download")
-  print("   5 => download and display")
-  print("   6 => upload")
-  print("   7 => add user")
-
-  cmd = int(input())
-  return cmd
-
+  return parse_command(read_line(MENU))
 
 ###################################################################
 #
 # Command 1: stats
 #
-def stats(bucketname, bucket, endpoint, dbConn):
+def stats(bucketname, bucket, endpoint, dbPool, executor):
   """
   Prints out S3 and RDS info: bucket name, # of assets, RDS 
   endpoint, and # of users and assets in the database
@@ -70,19 +184,37 @@ def stats(bucketname, bucket, endpoint, dbConn):
   bucketname: S3 bucket name,
   bucket: S3 boto bucket object,
   endpoint: RDS machine name,
-  dbConn: open connection to MySQL server
+  dbPool: pool of connections to MySQL server,
+  executor: thread pool used to overlap S3 and RDS requests
   
   Returns
   -------
   nothing
   """
+  #
+  # the S3 LIST and the MySQL counts are independent, so issue
+  # them concurrently; both counts come back from one query:
+  #
+  counts_query = """
+    SELECT (SELECT COUNT(*) FROM users),
+           (SELECT COUNT(*) FROM assets)
+    """
+
+  def db_counts():
+    with dbPool.connection() as dbConn:
+      return datatier.retrieve_one_row(dbConn, counts_query)
+
+  s3_future = executor.submit(awsutil.count_objects, bucket)
+  db_future = executor.submit(db_counts)
+
+  s3_assets_cnt = s3_future.result()
+  counts = db_future.result()
+
   #
   # bucket info:
   #
   print("S3 bucket name:", bucketname)
-
-  assets = bucket.objects.all()
-  print("S3 assets:", len(list(assets)))
+  print("S3 assets:", s3_assets_cnt)
 
   #
   # MySQL info:
@@ -92,115 +224,184 @@ def stats(bucketname, bucket, endpoint, dbConn):
   #
   # No. User info:
   #
-  users_query = "SELECT COUNT(*) FROM users"
-  users_cnt = datatier.retrieve_one_row(dbConn, users_query)
-  if users_cnt:
-    print("# of users:", users_cnt[0])
-
-  # Retrieve and print number of assets from assets table
-  assets_query = "SELECT COUNT(*) FROM assets"
-  assets_cnt = datatier.retrieve_one_row(dbConn, assets_query)
-  if assets_cnt:
-    print("# of assets:", assets_cnt[0])
+  if counts:
+    users_cnt, assets_cnt = counts
+    print("# of users:", users_cnt)
+
+    # print number of assets from assets table
+    print("# of assets:", assets_cnt)
+
+###################################################################
+#
+# page_rows
+#
+def page_rows(dbPool, first_query, next_query, format_row, page_size, ask_more):
+  """
+  Retrieves and outputs rows a page at a time, optionally asking
+  the user whether to continue after each full page. Pages are fetched
+  by keyset: the next page starts after the id (first column)
+  of the last row output.
+  
+  Parameters
+  ----------
+  dbPool: pool of connections to MySQL server,
+  first_query: query for the first page, parameterized by LIMIT,
+  next_query: query for later pages, parameterized by last id and LIMIT,
+  format_row: function formatting one row as a string,
+  page_size: max # of rows output per page,
+  ask_more: if True, asks before each page after the first;
+    otherwise outputs every page
+  
+  Returns
+  -------
+  nothing
+  """
+  last_id = None
+
+  while True:
+    # fetch one row beyond the page to learn whether there are more
+    if last_id is None:
+      sql, parameters = first_query, [page_size + 1]
+    else:
+      sql, parameters = next_query, [last_id, page_size + 1]
+
+    # a page is small, so fetch it all at once
+    with dbPool.connection() as dbConn:
+      rows = datatier.retrieve_all_rows(dbConn, sql, parameters)
+    if rows is None:  # query failed, error already logged
+      return
+
+    page = rows[:page_size]
+    sys.stdout.write("".join(format_row(row) for row in page))
+
+    if len(rows) <= page_size:  # that was the last page
+      return
+
+    if ask_more and read_line("Enter 'y' for more>\n") != "y":
+      return
+    last_id = page[-1][0]
+
 ###################################################################
 #
 # Command 2: users
 #
-def users(dbConn):
+def users(dbPool, page_size=50, ask_more=True):
   """
   Retrieves and outputs the users in the users table.
-  The users are output in descending order by user id.
+  The users are output in descending order by user id,
+  a page at a time.
   
   Parameters
   ----------
-  dbConn: open connection to MySQL server
+  dbPool: pool of connections to MySQL server,
+  page_size: max # of users output per page; default is 50,
+  ask_more: if True, asks before each further page; default is True.
   
   Returns
   -------
   nothing
   """
-  # Query for all users in users table in descending userid format
-  list_user_query = "SELECT * FROM users ORDER BY userid DESC"
-  users_ls = datatier.retrieve_all_rows(dbConn, list_user_query)
-
-  # unpack query output in standardized print statement
-  for user in users_ls:
-    id = user[0]
-    email = user[1]
-    full_name =  user[2] + " , " + user[3]
-    folder = user[4]
-    print("User Id:", id)
-    print("  Email:", email)
-    print("  Name:", full_name)
-    print("  Folder:", folder)
+  # Query for users in users table in descending userid format
+  first_user_query = "SELECT * FROM users ORDER BY userid DESC LIMIT %s"
+  next_user_query = "SELECT * FROM users WHERE userid < %s ORDER BY userid DESC LIMIT %s"
+
+  # format query output in standardized form
+  def format_user(user):
+    return (f"User Id: {user[0]}\n"
+            f"  Email: {user[1]}\n"
+            f"  Name: {user[2]} , {user[3]}\n"
+            f"  Folder: {user[4]}\n")
+
+  page_rows(dbPool, first_user_query, next_user_query, format_user, page_size, ask_more)
   
 ###################################################################
 #
 # Command 3: assets
 #
-def assets(dbConn):
+def assets(dbPool, page_size=50, ask_more=True):
   """
   Retrieves and outputs assets in the assets table.
-  The assets are output in descending order by asset id.
+  The assets are output in descending order by asset id,
+  a page at a time.
   
   Parameters
   ----------
-  dbConn: open connection to MySQL server
+  dbPool: pool of connections to MySQL server,
+  page_size: max # of assets output per page; default is 50,
+  ask_more: if True, asks before each further page; default is True.
   
   Returns
   -------
   nothing
   """
-  # query for all assets in table in descending assetid format
-  list_asset_query = "SELECT * FROM assets ORDER BY assetid DESC"
-  assets_ls = datatier.retrieve_all_rows(dbConn, list_asset_query)
-  # unpack query output to standardized print format
-  for asset in assets_ls:
+  # query for assets in table in descending assetid format
+  first_asset_query = """
+    SELECT assetid, userid, assetname, bucketkey FROM assets
+    ORDER BY assetid DESC LIMIT %s
+    """
+  next_asset_query = """
+    SELECT assetid, userid, assetname, bucketkey FROM assets
+    WHERE assetid < %s ORDER BY assetid DESC LIMIT %s
+    """
+
+  # format query output in standardized form
+  def format_asset(asset):
     asset_id, user_id, org_name, key_name = asset
-    print("Asset id:", asset_id)
-    print("  User id:", user_id)
-    print("  Original name:", org_name)
-    print("  Key name:", key_name)
+    return (f"Asset id: {asset_id}\n"
+            f"  User id: {user_id}\n"
+            f"  Original name: {org_name}\n"
+            f"  Key name: {key_name}\n")
+
+  page_rows(dbPool, first_asset_query, next_asset_query, format_asset, page_size, ask_more)
 
 ###################################################################
 #
 # Command 4 & 5: download and display
 #
-def download(dbConn, bucket, display=False):
+def download(dbPool, bucket, asset_id, display=False):
   """
-  Inputs an asset id, and then looks up that asset in the database, 
+  Given an asset id, looks up that asset in the database, 
   downloads the file, and renames it based on the original filename.
+  When displaying, the image is read into memory and shown without
+  being saved to disk.
   
   Parameters
   ----------
-  dbConn: open connection to MySQL server,
+  dbPool: pool of connections to MySQL server,
   bucket: S3 boto bucket object,
-  display: if True, displays the downloaded image; default is False.
+  asset_id: id of the asset to download,
+  display: if True, displays the image instead of saving it; default is False.
 
   Returns
   -------
   nothing
   """
-  # get asset id from user
-  print("Enter asset id>")
-  asset_id = str(input())
-
   # get bucket key and asset name for the specific user
-  file_info_query = "SELECT bucketkey, assetname FROM assets WHERE assetid = %s"
-  file_info = datatier.retrieve_one_row(dbConn, file_info_query,[asset_id,])
+  file_info_query = "SELECT bucketkey, assetname, filesize FROM assets WHERE assetid = %s"
+  with dbPool.connection() as dbConn:
+    file_info = datatier.retrieve_one_row(dbConn, file_info_query,[asset_id,])
 
   if file_info:
     # download file from bucket using info from query
-    key, orginial_fname = file_info
-    downloaded_file = awsutil.download_file(bucket,key,orginial_fname)
+    key, orginial_fname, filesize = file_info
+    # display asset straight from memory if specified
+    if display:
+      data = awsutil.get_object_bytes(bucket, key)
+      # check if asset exists in bucket
+      if data is not None:
+        print("Downloaded from S3 ' ", orginial_fname, " '")
+        extension = os.path.splitext(orginial_fname)[1][1:]
+        image = img.imread(io.BytesIO(data), format=extension)
+        plt.imshow(image)
+        plt.show()
+      else:
+        print("No such asset...")
+      return
+
+    downloaded_file = awsutil.download_file(bucket,key,orginial_fname,filesize)
     # check if asset exists in bucket
     if downloaded_file:
       print("Downloaded from S3 and saved as ' ", orginial_fname, " '")
-      # display asset if specified
-      if display:
-        image = img.imread(downloaded_file)
-        plt.imshow(image)
-        plt.show()
     else:
       print("No such asset...")
   else:
@@ -210,96 +411,269 @@ def download(dbConn, bucket, display=False):
 #
 # Command 6: upload
 #
-def upload(dbConn, bucket):
+def upload(dbPool, bucket, local_fname, user_id):
   """
-  Inputs the name of a local file, and a user id, and then uploads that file to the user’s folder in S3. 
+  Given the name of a local file, and a user id, uploads that file to the user’s folder in S3. 
   The file is given a unique name in S3 (use UUID module), and a row containing the asset’s information 
   --- user id, original filename, and full bucket key --- is inserted into the assets table
   
   Parameters
   ----------
-  dbConn: open connection to MySQL server,
+  dbPool: pool of connections to MySQL server,
   bucket: S3 boto bucket object,
+  local_fname: name of the local file to upload,
+  user_id: id of the user who owns the file
 
   Returns
   -------
   nothing
   """
-  # Obtain local filename from user
-  print("Enter local filename>")
-  local_fname = str(input()) 
   # Check if local file exists
   if not os.path.exists(local_fname):
     print(f"Local file ' {local_fname} ' does not exist...")
     return
-  
-  # Obtain user id from user
-  print("Enter user id>")
-  user_id = str(input())
-  # Check if user id exists
-  check_user_query = "SELECT userid FROM users WHERE userid = %s"
-  if not datatier.retrieve_one_row(dbConn, check_user_query, [user_id]):
+
+  # user ids are numbers, anything else can't be a user
+  try:
+    user_id = int(user_id)
+  except ValueError:
     print("No such user...")
     return
-  
-  # Create uuid filename and upload to S3 bucket
-  key = str(uuid.uuid4()) + pathlib.Path(local_fname).suffix
-  s3_key = awsutil.upload_file(local_fname, bucket, key)
-  if not s3_key:
-    print("Failed to upload the file to S3.")
-    return
-  else:
-    print(f"Uploaded and stored in S3 as ' {s3_key} '")
 
-  # Insert upload data to RDS
-  insert_query = "INSERT INTO assets(userid, assetname, bucketkey) VALUES (%s, %s, %s)"
-  res = datatier.perform_action(dbConn, insert_query, [user_id, local_fname, s3_key])
-  if res <= 0:
-    print("Failed to insert asset info into the database.")
-  else:
-    # Get the last inserted asset id and print it
-    asset_id_query = "SELECT LAST_INSERT_ID();"
-    last_id = datatier.retrieve_one_row(dbConn, asset_id_query)
-    print("Recorded in RDS under asset id ", last_id[0])
+  # Create uuid filename for S3
+  key = f"{uuid.uuid4().hex}{os.path.splitext(local_fname)[1]}"
+
+  # Insert upload data to RDS first, inside a transaction; the
+  # foreign key on assets.userid rejects an unknown user before
+  # any bytes are sent to S3, and the row is only committed once
+  # the object is in S3. perform_action begins the transaction
+  # (pooled connections autocommit), and the pool rolls back
+  # anything left uncommitted when the connection is returned.
+  filesize = os.path.getsize(local_fname)
+  insert_query = "INSERT INTO assets(userid, assetname, bucketkey, filesize) VALUES (%s, %s, %s, %s)"
+  commit_failed = False
+  try:
+    with dbPool.connection() as dbConn:
+      try:
+        res, last_id = datatier.perform_action(dbConn, insert_query, [user_id, local_fname, key, filesize], commit=False)
+      except datatier.IntegrityError as e:
+        if e.args[0] == datatier.ER_NO_REFERENCED_ROW:
+          print("No such user...")
+          return
+        res = -1
+      if res <= 0:
+        print("Failed to insert asset info into the database.")
+        return
+
+      # upload to S3 bucket
+      s3_key = awsutil.upload_file(local_fname, bucket, key)
+      if not s3_key:
+        print("Failed to upload the file to S3.")
+        return
+
+      try:
+        dbConn.commit()
+      except Exception:
+        # re-raised so the pool discards the connection
+        commit_failed = True
+        raise
+
+  except Exception as e:
+    logging.error(e)
+    if not commit_failed:
+      print("Failed to insert asset info into the database.")
+      return
+
+    # if the connection was lost during COMMIT, the server may
+    # still have committed; look for the row on a fresh connection
+    check_query = "SELECT assetid FROM assets WHERE bucketkey = %s"
+    try:
+      with dbPool.connection() as dbConn:
+        row = datatier.retrieve_one_row(dbConn, check_query, [key])
+    except Exception as e:
+      logging.error(e)
+      row = None
+
+    if not row:
+      # only delete the object when the row is known not to exist,
+      # so a committed row never refers to a missing object
+      if row == ():
+        awsutil.delete_file(bucket, s3_key)
+      print("Failed to insert asset info into the database.")
+      return
+    last_id = row[0]
+
+  print(f"Uploaded and stored in S3 as ' {s3_key} '")
+  # print the asset id generated by the insert
+  print("Recorded in RDS under asset id ", last_id)
 
 ###################################################################
 #
 # Command 7: add user
 #
-def add_user(dbConn, bucket):
+def add_user(dbPool, email, last_name, first_name):
   """
-  Inputs data about a new user and inserts a new row into the users table. 
-  Input the new user’s email, last name, and first name.
+  Given data about a new user, inserts a new row into the users table. 
+  The data is the new user’s email, last name, and first name.
   
   Parameters
   ----------
-  dbConn: open connection to MySQL server,
-  bucket: S3 boto bucket object,
+  dbPool: pool of connections to MySQL server,
+  email: new user's email,
+  last_name: new user's last (family) name,
+  first_name: new user's first (given) name
 
   Returns
   -------
   nothing
   """
-  # obtain user's email, last name and first name
-  print("Enter user's email>")
-  email = str(input())
-  print("Enter user's last (family) name>")
-  last_name = str(input())
-  print("Enter user's first (given) name>")
-  first_name = str(input())
-
-  folder = str(uuid.uuid4())
+  folder = uuid.uuid4().hex
 
   # insert user in users table as a new row
   insert_query = "INSERT INTO users(email, lastname, firstname, bucketfolder) VALUES (%s, %s, %s, %s)"
-  res = datatier.perform_action(dbConn, insert_query, [email, last_name, first_name, folder])
+  with dbPool.connection() as dbConn:
+    try:
+      res, last_id = datatier.perform_action(dbConn, insert_query, [email, last_name, first_name, folder])
+    except datatier.IntegrityError:  # e.g. email already in use
+      res = -1
   if res <= 0:
     print("Failed to insert user info into the database.")
   else:
-    # Get the last inserted asset id and print it
-    id_query = "SELECT LAST_INSERT_ID();"
-    last_id = datatier.retrieve_one_row(dbConn, id_query)
-    print("Recorded in RDS under user id ", last_id[0])
+    # print the user id generated by the insert
+    print("Recorded in RDS under user id ", last_id)
+
+###################################################################
+#
+# Command 8: download batch
+#
+def download_batch(dbPool, bucket, asset_ids):
+  """
+  Given a list of asset ids, looks up those assets in the database,
+  and downloads the files in parallel, naming each based on its
+  original filename.
+  
+  Parameters
+  ----------
+  dbPool: pool of connections to MySQL server,
+  bucket: S3 boto bucket object,
+  asset_ids: list of ids of the assets to download
+
+  Returns
+  -------
+  nothing
+  """
+  # parse the asset ids, in order and without repeats
+  ids = []
+  for token in asset_ids:
+    try:
+      asset_id = int(token)
+    except ValueError:
+      print(f"Invalid asset id ' {token} '...")
+      continue
+    if asset_id not in ids:
+      ids.append(asset_id)
+  if not ids:
+    return
+
+  # get bucket key and asset name for each asset in one query
+  placeholders = ", ".join(["%s"] * len(ids))
+  files_info_query = f"SELECT assetid, bucketkey, assetname, filesize FROM assets WHERE assetid IN ({placeholders})"
+  with dbPool.connection() as dbConn:
+    files_info = datatier.retrieve_all_rows(dbConn, files_info_query, ids)
+  if files_info is None:
+    return
+
+  found = {asset_id: (key, fname, size) for asset_id, key, fname, size in files_info}
+
+  # only one asset per local filename, so downloads don't overwrite
+  # each other
+  keys, fnames, sizes = [], [], []
+  for asset_id in ids:
+    if asset_id not in found:
+      print(f"No such asset ' {asset_id} '...")
+      continue
+    key, fname, size = found[asset_id]
+    if fname in fnames:
+      print(f"Skipped asset ' {asset_id} ', another asset in this batch is saved as ' {fname} '...")
+      continue
+    keys.append(key)
+    fnames.append(fname)
+    sizes.append(size)
+
+  # download the files, all at once
+  downloaded_files = awsutil.download_many(bucket, keys, fnames, sizes)
+
+  for fname, downloaded_file in zip(fnames, downloaded_files):
+    if downloaded_file:
+      print("Downloaded from S3 and saved as ' ", fname, " '")
+    else:
+      print(f"Failed to download ' {fname} '...")
+
+###################################################################
+#
+# init_session
+#
+@functools.lru_cache
+def init_session(config_file):
+  """
+  Reads the S3 and RDS settings from the config file, and points
+  AWS at the config file for credentials. The result is cached,
+  so the file is only parsed once per session.
+  
+  Parameters
+  ----------
+  config_file: name of the config file for this session
+  
+  Returns
+  -------
+  dict of the settings in the [s3] and [rds] sections
+  """
+  os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+
+  configur = ConfigParser()
+  configur.read(config_file)
+
+  return dict(configur.items('s3')) | dict(configur.items('rds'))
+
+###################################################################
+#
+# get_bucket
+#
+@functools.lru_cache
+def get_bucket(config_file):
+  """
+  Sets up the boto3 session and returns the S3 bucket. This is
+  deferred until the first command that needs S3, and the
+  bucket is cached for the rest of the session. All awsutil
+  helpers go through the bucket's client, so they share its
+  connection pool.
+  
+  Parameters
+  ----------
+  config_file: name of the config file for this session
+  
+  Returns
+  -------
+  S3 boto bucket object
+  """
+  config = init_session(config_file)
+
+  s3_profile = 's3readwrite'
+  boto3.setup_default_session(profile_name=s3_profile)
+
+  #
+  # one client (and HTTP connection pool) serves every S3 call;
+  # size the pool for a batch download, where every file may be
+  # transferring all of its parts at once:
+  #
+  max_connections = awsutil.DOWNLOAD_WORKERS * awsutil.TRANSFER_CONFIG.max_concurrency
+
+  s3_config = botocore.config.Config(
+    max_pool_connections=max(32, (os.cpu_count() or 1) * 5, max_connections),
+    retries={'max_attempts': 10, 'mode': 'adaptive'})
+
+  s3 = boto3.resource('s3', config=s3_config)
+  return s3.Bucket(config['bucket_name'])
 
 #########################################################################
 # main
@@ -315,10 +689,9 @@ sys.tracebacklimit = 0
 #
 config_file = 'photoapp-config.ini'
 
-print("What config file to use for this session?")
-print("Press ENTER to use default (photoapp-config.ini),")
-print("otherwise enter name of config file>")
-s = input()
+s = read_line("What config file to use for this session?\n"
+              "Press ENTER to use default (photoapp-config.ini),\n"
+              "otherwise enter name of config file>\n")
 
 if s == "":  # use default
   pass  # already set
@@ -328,76 +701,83 @@ else:
 #
 # does config file exist?
 #
-if not pathlib.Path(config_file).is_file():
+if not os.path.isfile(config_file):
   print("**ERROR: config file '", config_file, "' does not exist, exiting")
   sys.exit(0)
 
 #
-# gain access to our S3 bucket:
+# read our settings; access to the S3 bucket is set up
+# on first use (see get_bucket):
 #
-s3_profile = 's3readwrite'
-
-os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-
-boto3.setup_default_session(profile_name=s3_profile)
-
-configur = ConfigParser()
-configur.read(config_file)
-bucketname = configur.get('s3', 'bucket_name')
-
-s3 = boto3.resource('s3')
-bucket = s3.Bucket(bucketname)
+config = init_session(config_file)
+bucketname = config['bucket_name']
 
 #
 # now let's connect to our RDS MySQL server:
 #
-endpoint = configur.get('rds', 'endpoint')
-portnum = int(configur.get('rds', 'port_number'))
-username = configur.get('rds', 'user_name')
-pwd = configur.get('rds', 'user_pwd')
-dbname = configur.get('rds', 'db_name')
+endpoint = config['endpoint']
+portnum = int(config['port_number'])
+username = config['user_name']
+pwd = config['user_pwd']
+dbname = config['db_name']
 
-dbConn = datatier.get_dbConn(endpoint, portnum, username, pwd, dbname)
+dbPool = datatier.get_dbPool(endpoint, portnum, username, pwd, dbname)
 
-if dbConn is None:
+if dbPool is None:
   print('**ERROR: unable to connect to database, exiting')
   sys.exit(0)
 
+#
+# worker threads for overlapping S3 and RDS requests, kept for
+# the whole session rather than started per command:
+#
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+#
+# command handlers, looked up by command number; each is given
+# the arguments that followed the command number, and prompts
+# for any that are missing:
+#
+HANDLERS = {
+  1: lambda args: stats(bucketname, get_bucket(config_file), endpoint, dbPool, executor),
+  2: lambda args: users(dbPool, *page_options(args)),
+  3: lambda args: assets(dbPool, *page_options(args)),
+  4: lambda args: download(dbPool, get_bucket(config_file),
+                           get_arg(args, 0, "Enter asset id>")),
+  5: lambda args: download(dbPool, get_bucket(config_file),
+                           get_arg(args, 0, "Enter asset id>"),
+                           display=True),
+  6: lambda args: upload(dbPool, get_bucket(config_file),
+                         get_arg(args, 0, "Enter local filename>"),
+                         get_arg(args, 1, "Enter user id>")),
+  7: lambda args: add_user(dbPool,
+                           get_arg(args, 0, "Enter user's email>"),
+                           get_arg(args, 1, "Enter user's last (family) name>"),
+                           get_arg(args, 2, "Enter user's first (given) name>")),
+  8: lambda args: download_batch(dbPool, get_bucket(config_file),
+                                 args or read_line("Enter asset ids separated by spaces>\n").split()),
+}
+
 #
 # main processing loop:
 #
-cmd = prompt()
+cmd, args = prompt()
 
 while cmd != 0:
   #
-  if cmd == 1:
-    stats(bucketname, bucket, endpoint, dbConn)
-
-  elif cmd == 2:
-    users(dbConn)
-
-  elif cmd == 3:
-    assets(dbConn)
-
-  elif cmd == 4:
-    download(dbConn, bucket)
-
-  elif cmd == 5:
-    download(dbConn, bucket, display=True)
-
-  elif cmd == 6:
-    upload(dbConn, bucket)
-
-  elif cmd == 7:
-    add_user(dbConn, bucket)
-    
+  handler = HANDLERS.get(cmd)
+  if handler:
+    handler(args)
   else:
     print("** Unknown command, try again...")
   #
-  cmd = prompt()
+  cmd, args = prompt()
 
 #
 # done
 #
+executor.shutdown()
+dbPool.close()
+
 print()
 print('** done **')